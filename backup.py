@@ -0,0 +1,218 @@
+'''
+Модуль резервного копирования (выгрузки) и восстановления
+данных пользователей: таблиц "user" и "study".
+
+Строки выгружаются частями (chunk) в порядке первичного ключа: каждая часть выбирается
+отдельной короткой транзакцией и потоково (yield_per) записывается в сжатый
+файл формата JSONL, поэтому потребление памяти не зависит от размера таблиц,
+а Telegram-бот продолжает работу во время выгрузки. После записи каждой части
+сохраняется контрольная точка, прерванная выгрузка (восстановление) продолжается с нее.
+
+Запуск:
+    python backup.py export [--dir каталог] [--chunk-size N] [--restart]
+    python backup.py restore --dir каталог [--restart]
+
+'''
+import argparse
+import glob
+import gzip
+import json
+import os
+from datetime import date
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import DBaseConfig, Study, User, Word
+
+# Количество строк в одной части выгрузки и в одном пакете потоковой выборки
+CHUNK_SIZE = 10000
+YIELD_PER = 1000
+
+# Таблицы выгрузки: {название: (модель, первичный ключ, выгружаемые столбцы)}.
+# Для "study" дополнительно выгружаются слово и перевод (для аналитики),
+# при восстановлении используются только столбцы модели.
+TABLES = {
+    'user': (User, User.id_user, (User.id_user, User.id_chat, User.language)),
+    'study': (Study, Study.id_study, (Study.id_study, Study.id_word, Study.id_user, Study.date,
+                                      Word.title, Word.translation)),
+}
+
+
+class Backup:
+    '''Статический класс выгрузки и восстановления данных пользователей.
+
+    '''
+    @staticmethod
+    def _checkpoint_path(directory: str, table: str, action: str) -> str:
+        return os.path.join(directory, f'{table}.{action}.checkpoint.json')
+
+    @staticmethod
+    def _chunk_path(directory: str, table: str, chunk: int) -> str:
+        return os.path.join(directory, f'{table}-{chunk:06d}.jsonl.gz')
+
+    @staticmethod
+    def _remove_chunks(directory: str, table: str) -> None:
+        '''Функция удаления файлов частей предыдущей выгрузки таблицы,
+           чтобы восстановление не прочитало их вместе с частями новой выгрузки.
+
+        '''
+        for path in glob.glob(os.path.join(glob.escape(directory), f'{table}-*.jsonl.gz*')):
+            os.remove(path)
+
+    @staticmethod
+    def _read_checkpoint(path: str, restart: bool, default: dict) -> dict:
+        '''Функция чтения контрольной точки.
+           Возвращает default при ее отсутствии либо при restart=True.
+
+        '''
+        if restart or not os.path.exists(path):
+            return default
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+
+    @staticmethod
+    def _write_checkpoint(path: str, checkpoint: dict) -> None:
+        '''Функция атомарной записи контрольной точки.
+
+        '''
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as file:
+            json.dump(checkpoint, file)
+        os.replace(f'{path}.tmp', path)
+
+    @staticmethod
+    def export_table(table: str, directory: str, chunk_size: int = CHUNK_SIZE,
+                     restart: bool = False) -> int:
+        '''Функция выгрузки таблицы в сжатые файлы JSONL.
+           Таблица "study" выгружается только для пользователей, выгруженных ранее
+           (id_user не больше последнего ключа выгрузки "user"), чтобы копия
+           не содержала ссылок на отсутствующих в ней пользователей.
+           Выгрузка с начала (restart либо без контрольной точки) удаляет файлы
+           частей предыдущей выгрузки таблицы.
+           Возвращает количество выгруженных строк (с учетом выгруженных ранее).
+
+        '''
+        model, key, columns = TABLES[table]
+        names = [column.key for column in columns]
+        checkpoint_path = Backup._checkpoint_path(directory, table, 'export')
+        checkpoint = Backup._read_checkpoint(checkpoint_path, restart,
+                                             {'last_key': None, 'chunk': 0, 'rows': 0,
+                                              'done': False})
+        if not checkpoint['chunk'] and not checkpoint['done']:
+            Backup._remove_chunks(directory, table)
+        if table == 'study' and 'user_high_water' not in checkpoint:
+            users = Backup._read_checkpoint(Backup._checkpoint_path(directory, 'user', 'export'),
+                                            False, {'last_key': None})
+            checkpoint['user_high_water'] = users['last_key']
+        while not checkpoint['done']:
+            query = select(*columns).select_from(model).order_by(key).limit(chunk_size)
+            if table == 'study':
+                query = query.join(Word, Word.id_word == Study.id_word) \
+                             .where(Study.id_user <= (checkpoint['user_high_water'] or 0))
+            if checkpoint['last_key'] is not None:
+                query = query.where(key > checkpoint['last_key'])
+            chunk_path = Backup._chunk_path(directory, table, checkpoint['chunk'] + 1)
+            rows, last_key = 0, checkpoint['last_key']
+            with DBaseConfig.Session() as session, \
+                 gzip.open(f'{chunk_path}.tmp', 'wt', encoding='utf-8') as file:
+                result = session.execute(query.execution_options(yield_per=YIELD_PER))
+                for row in result:
+                    record = dict(zip(names, row))
+                    file.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+                    rows, last_key = rows + 1, row[0]
+            if rows:
+                os.replace(f'{chunk_path}.tmp', chunk_path)
+                checkpoint.update(last_key=last_key, chunk=checkpoint['chunk'] + 1,
+                                  rows=checkpoint['rows'] + rows)
+            else:
+                os.remove(f'{chunk_path}.tmp')
+            checkpoint['done'] = rows < chunk_size
+            Backup._write_checkpoint(checkpoint_path, checkpoint)
+        return checkpoint['rows']
+
+    @staticmethod
+    def _insert(session, model):
+        '''Функция формирования запроса вставки, пропускающего строки с уже
+           имеющимся первичным ключом (PostgreSQL, SQLite). Повторное восстановление
+           части, прерванное после фиксации транзакции, не приводит к ошибке.
+
+        '''
+        match session.bind.dialect.name:
+            case 'postgresql':
+                return postgresql.insert(model).on_conflict_do_nothing()
+            case 'sqlite':
+                return sqlite.insert(model).on_conflict_do_nothing()
+        return insert(model)
+
+    @staticmethod
+    def _reset_sequence(session, model, key) -> None:
+        '''Функция установки счетчика (sequence) первичного ключа PostgreSQL
+           после максимального восстановленного значения, иначе следующая вставка
+           (например, add_new_user) завершится ошибкой повторяющегося ключа.
+           Для SQLite не требуется.
+
+        '''
+        if session.bind.dialect.name != 'postgresql':
+            return
+        table = model.__table__.name
+        next_key = (session.scalar(select(func.max(key))) or 0) + 1
+        session.execute(text('SELECT setval(pg_get_serial_sequence(:table, :column), :value, false)'),
+                        {'table': f'"{table}"', 'column': key.key, 'value': next_key})
+        session.commit()
+
+    @staticmethod
+    def restore_table(table: str, directory: str, restart: bool = False) -> int:
+        '''Функция восстановления таблицы из сжатых файлов JSONL.
+           Каждая часть вставляется пакетами по YIELD_PER строк одной транзакцией,
+           строки с уже имеющимся первичным ключом пропускаются и не учитываются.
+           Предполагается восстановление в пустую таблицу.
+           Возвращает количество вставленных строк (с учетом восстановленных ранее).
+
+        '''
+        model, key, _ = TABLES[table]
+        names = {column.key for column in model.__table__.columns}
+        checkpoint_path = Backup._checkpoint_path(directory, table, 'restore')
+        checkpoint = Backup._read_checkpoint(checkpoint_path, restart, {'chunk': 0, 'rows': 0})
+        chunk = checkpoint['chunk'] + 1
+        while os.path.exists(chunk_path := Backup._chunk_path(directory, table, chunk)):
+            rows = 0
+            with DBaseConfig.Session() as session, \
+                 gzip.open(chunk_path, 'rt', encoding='utf-8') as file:
+                # Возвращаются ключи только вставленных строк (пропущенные не учитываются)
+                query, batch = Backup._insert(session, model).returning(key), []
+                for line in file:
+                    record = {name: value for name, value in json.loads(line).items()
+                              if name in names}
+                    if 'date' in record:
+                        record['date'] = date.fromisoformat(record['date'])
+                    batch.append(record)
+                    if len(batch) == YIELD_PER:
+                        rows, batch = rows + len(session.scalars(query, batch).all()), []
+                if batch:
+                    rows += len(session.scalars(query, batch).all())
+                session.commit()
+            checkpoint.update(chunk=chunk, rows=checkpoint['rows'] + rows)
+            Backup._write_checkpoint(checkpoint_path, checkpoint)
+            chunk += 1
+        with DBaseConfig.Session() as session:
+            Backup._reset_sequence(session, model, key)
+        return checkpoint['rows']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Выгрузка и восстановление данных пользователей')
+    parser.add_argument('action', choices=('export', 'restore'))
+    parser.add_argument('--dir', default=os.path.join(os.getcwd(), 'data', 'backup',
+                                                      date.today().isoformat()))
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--restart', action='store_true',
+                        help='начать заново, не используя контрольные точки')
+    args = parser.parse_args()
+
+    os.makedirs(args.dir, exist_ok=True)
+    for table in TABLES:
+        if args.action == 'export':
+            total = Backup.export_table(table, args.dir, args.chunk_size, args.restart)
+        else:
+            total = Backup.restore_table(table, args.dir, args.restart)
+        print(f'{table}: {total} rows ({args.action}).')
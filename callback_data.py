@@ -0,0 +1,132 @@
+'''
+Модуль подписи данных inline-кнопок (callback_data) карточек.
+
+Каждая кнопка-вариант ответа хранит идентификатор целевого слова, идентификатор
+слова-варианта и время формирования карточки, подписанные HMAC, поэтому ответ
+пользователя и срок действия карточки проверяются без обращения к хранилищу
+состояний бота (любым процессом бота).
+
+'''
+import hmac
+from base64 import urlsafe_b64encode
+from hashlib import sha256
+from time import time
+
+from config import CALLBACK_SECRET
+
+# Префиксы данных inline-кнопок: вариант ответа и переход к следующей карточке
+OPTION = 'o'
+NEXT_CARD = 'n'
+
+SEPARATOR = ':'
+# Длина подписи в символах base64 (callback_data ограничена 64 байтами)
+SIGNATURE_LENGTH = 16
+
+
+class CallbackData:
+    '''Статический класс формирования и проверки подписанных данных inline-кнопок.
+
+       Формат данных кнопки-варианта: 'o:id_word:option:issued:signature',
+       кнопки перехода к следующей карточке: 'n:issued:signature',
+       где issued - время формирования карточки (в секундах Unix),
+       числа записываются в 36-ричной системе счисления.
+       Подпись вычисляется с учетом идентификатора чата, поэтому данные
+       кнопки одного чата недействительны в другом.
+
+    '''
+    @staticmethod
+    def _sign(chat_id: int, payload: str) -> str:
+        '''Функция вычисления подписи данных кнопки.
+
+        '''
+        key = (CALLBACK_SECRET or '').encode()
+        digest = hmac.new(key, f'{chat_id}{SEPARATOR}{payload}'.encode(), sha256).digest()
+        return urlsafe_b64encode(digest).decode()[:SIGNATURE_LENGTH]
+
+    @staticmethod
+    def _pack(chat_id: int, prefix: str, *numbers: int) -> str:
+        '''Функция формирования подписанных данных кнопки из префикса и чисел.
+
+        '''
+        payload = SEPARATOR.join((prefix, *map(_to_base36, numbers)))
+        return f'{payload}{SEPARATOR}{CallbackData._sign(chat_id, payload)}'
+
+    @staticmethod
+    def _unpack(chat_id: int, prefix: str, data: str) -> tuple | None:
+        '''Функция проверки подписи и разбора данных кнопки с префиксом prefix.
+           Возвращает кортеж чисел либо None, если данные повреждены или подпись неверна.
+
+        '''
+        payload, _, signature = data.rpartition(SEPARATOR)
+        if not hmac.compare_digest(signature, CallbackData._sign(chat_id, payload)):
+            return None
+        first, *numbers = payload.split(SEPARATOR)
+        if first != prefix:
+            return None
+        try:
+            return tuple(int(number, 36) for number in numbers)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def issued_now() -> int:
+        '''Функция получения времени формирования карточки.
+
+        '''
+        return int(time())
+
+    @staticmethod
+    def is_expired(issued: int, ttl: float) -> bool:
+        '''Функция проверки срока действия карточки, сформированной в момент issued.
+
+        '''
+        return not 0 <= time() - issued <= ttl
+
+    @staticmethod
+    def pack_option(chat_id: int, word_id: int, option_id: int, issued: int) -> str:
+        '''Функция формирования подписанных данных кнопки-варианта ответа.
+           Возвращает строку: 'o:id_word:option:issued:signature'
+
+        '''
+        return CallbackData._pack(chat_id, OPTION, word_id, option_id, issued)
+
+    @staticmethod
+    def unpack_option(chat_id: int, data: str) -> tuple | None:
+        '''Функция проверки подписи и разбора данных кнопки-варианта ответа.
+           Возвращает кортеж (id_word, option, issued) либо None,
+           если данные повреждены или подпись неверна.
+
+        '''
+        option = CallbackData._unpack(chat_id, OPTION, data)
+        return option if option is not None and len(option) == 3 else None
+
+    @staticmethod
+    def pack_next_card(chat_id: int, issued: int) -> str:
+        '''Функция формирования подписанных данных кнопки перехода к следующей карточке.
+           Возвращает строку: 'n:issued:signature'
+
+        '''
+        return CallbackData._pack(chat_id, NEXT_CARD, issued)
+
+    @staticmethod
+    def unpack_next_card(chat_id: int, data: str) -> int | None:
+        '''Функция проверки подписи и разбора данных кнопки перехода к следующей карточке.
+           Возвращает время формирования карточки либо None,
+           если данные повреждены или подпись неверна.
+
+        '''
+        next_card = CallbackData._unpack(chat_id, NEXT_CARD, data)
+        return next_card[0] if next_card is not None and len(next_card) == 1 else None
+
+
+def _to_base36(number: int) -> str:
+    '''Функция записи неотрицательного целого числа в 36-ричной системе счисления.
+
+    '''
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    result = ''
+    while True:
+        number, rest = divmod(number, 36)
+        result = digits[rest] + result
+        if not number:
+            return result
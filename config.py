@@ -15,3 +15,24 @@ DB_PASSWORD = os.getenv('PSQLPASS')
 DB_CONNECTION = 'localhost'
 DB_PORT = '5432'
 DB_NAME = 'pyCards'
+
+# Ключ подписи данных inline-кнопок карточек (режим /inline)
+CALLBACK_SECRET = os.getenv('CALLBACKSECRET') or TGBOT_TOKEN
+# Срок действия (в секундах) inline-карточки: нажатия кнопок более старых карточек отклоняются
+INLINE_CARD_TTL = 10 * 60
+
+# Путь к снимку словаря для совместного использования несколькими процессами бота
+VOCABULARY_PATH = os.path.join(os.getcwd(), 'data', 'vocabulary.bin')
+
+# Ограничение частоты сообщений одного чата: обновлений в секунду, максимальная серия
+# и интервал (в секундах), в течение которого одинаковые сообщения считаются повтором
+FLOOD_RATE = 1.0
+FLOOD_BURST = 5
+FLOOD_DUPLICATE_WINDOW = 1.5
+
+# Количество потоков обработки сообщений (сообщения разных чатов обрабатываются параллельно)
+BOT_THREADS = 4
+
+# Время (в секундах) без ответов пользователя, после которого сессия повторения
+# слов завершается автоматически с сохранением дат повторенных слов
+REVIEW_TIMEOUT = 15 * 60
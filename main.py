@@ -3,31 +3,65 @@
 и его взаимодействия с базой данных PostgreSQL.
 
 '''
+import logging
+import os
+import threading
 from datetime import date, timedelta
 from functools import lru_cache
-from random import choice, randint, sample, shuffle
+from random import choice, shuffle
+from time import monotonic
 
-from sqlalchemy import distinct
+from sqlalchemy.orm import scoped_session
 from telebot import TeleBot, types
 from telebot.handler_backends import State, StatesGroup
 from telebot.storage import StateMemoryStorage
 
-from config import TGBOT_TOKEN
+from callback_data import NEXT_CARD, SEPARATOR, CallbackData
+from config import (BOT_THREADS, FLOOD_BURST, FLOOD_DUPLICATE_WINDOW, FLOOD_RATE,
+                    INLINE_CARD_TTL, REVIEW_TIMEOUT, TGBOT_TOKEN, VOCABULARY_PATH)
 from models import DBaseConfig, Study, User, Word
+from router import ChatLocks, FloodControl, Router, error_middleware, timing_middleware
+from vocabulary import VocabularyCache, VocabularySnapshot, VocabularyWatcher
+
+logger = logging.getLogger(__name__)
 
 # BACKEND_INFO - оперативный словарь.
-# Хранит информацию о количестве частей речи, находящихся в базе данных (для подготовки карточек)
-# и данные о языке отображаемых карточек (ru-en, en-ru) для каждого пользователя.
-# Информация хранится в виде:
-# {'types': [id_type_1, id_type_2...], chat_id_1: 'russian', chat_id_2: 'english',...}
+# Хранит данные о языке отображаемых карточек (ru-en, en-ru) для каждого пользователя.
+# Информация хранится в виде: {chat_id_1: 'russian', chat_id_2: 'english',...}
 BACKEND_INFO = {}
 
+# VOCABULARY - словарь для карточек (модуль 'vocabulary.py'): снимок словаря, общий
+# для всех процессов бота, либо, при отсутствии файла снимка, словарь в памяти процесса.
+# Загружается функцией startup до начала обработки сообщений.
+# Перезагружается фоновым потоком VocabularyWatcher без перезапуска бота.
+VOCABULARY = None
+
+# REVIEW_SESSIONS - начатые сессии повторения слов из персонального списка.
+# Информация хранится в виде: {chat_id_1: ReviewSession, chat_id_2: ReviewSession,...}
+REVIEW_SESSIONS = {}
+
+# session - сессия подключения к базе данных, используемая функциями класса DBase.
+# Каждый поток обработки сообщений получает собственную сессию (scoped_session),
+# которая закрывается по окончании обработки обновления (DBase.session_middleware).
+session = scoped_session(DBaseConfig.Session)
+
 class DBase:
     '''Статический класс для работы с базой данных PostgreSQL.
 
        Для взаимодействия с базой данных необходимо в файл .config ввести параметры подключения.
        
     '''
+    @staticmethod
+    def session_middleware(handler, update) -> None:
+        '''Middleware сессии подключения к базе данных: по окончании обработки
+           обновления закрывает сессию потока, возвращая соединение в пул.
+
+        '''
+        try:
+            handler(update)
+        finally:
+            session.remove()
+
     @lru_cache(maxsize=32)
     @staticmethod
     def _pulling_info_word_id(word: str, chat_id: int) -> int:
@@ -51,51 +85,48 @@ class DBase:
         return session.query(User).filter(User.id_chat == chat_id).first().id_user
 
     @staticmethod
-    def planning_for_today() -> dict:
-        '''Функция выборки информации об идентификаторе чата пользователей (id_chat) 
-           и слов (id_word) из таблицы "study", соответствующие условию: добавлены 
-           в персональный список ранее текущей даты.
-           Возвращает словарь: {id_chat: [id_word, id_word...], id_chat:...}
+    def _sampling_words(type_id: int, k: int, exclude: int | None = None) -> list:
+        '''Функция случайной выборки k слов заданной части речи (кроме слова exclude)
+           из словаря VOCABULARY.
+           Возвращает список: [(id_word, word_title, word_translation),...]
 
-           Используется при подключении модуля 'notifications.py'.
+        '''
+        return VOCABULARY.sample_words(type_id, k, exclude)
+
+    @staticmethod
+    def _choice_type() -> int:
+        '''Функция случайного выбора части речи (id_type) для карточек.
 
         '''
-        query = session.query(Study).with_entities(User.id_chat, Study.id_word)\
-                       .join(User.study).filter(Study.date < date.today()).all()
-        if query:
-            return {key[0]:[value[1] for value in query if value[0] == key[0]]for key in query}
+        return choice(VOCABULARY.types())
 
     @staticmethod
-    def pull_out_schedule_words_for_cards(word_id: int) -> list:
-        '''Функция выборки целевого и вспомогательных слов для карточек.
-           Язык целевого слова выбирается случайным образом.
-           Возвращает кортеж из целевого слова, его перевода, кортежа из слов-вариантов 
-           перевода и флага-индикатора выбранного языка (0 - 'english', 1 - 'ru-en):
-           (word_title, word_translation, [word_translation,...], flag) или
-           (word_translation, word_title, [word_title,...], flag).
+    def pull_out_review_words(chat_id: int) -> list:
+        '''Функция выборки всех слов персонального списка пользователя, которые
+           пора повторить (дата в таблице "study" ранее текущей), одним запросом.
+           Варианты перевода для карточек выбираются из словаря VOCABULARY.
+           Возвращает список: [(id_word, id_type, word_title, word_translation),...]
 
            Используется при подключении модуля 'notifications.py'.
 
         '''
-        type_id, *target_word = session.query(Word)\
-                                       .with_entities(Word.id_type, Word.title, Word.translation)\
-                                       .filter(Word.id_word == word_id).all()[0]
-        other_words = session.query(Word).with_entities(Word.title, Word.translation)\
-                             .filter(Word.id_type == type_id).all()
-        other_words = sample(other_words, k=3)
-        flag = randint(1, 100) % 2
-        target_word, target_word_transl = target_word[flag], target_word[1 - flag]
-        words_transl = [word[1 - flag] for word in other_words] + [target_word_transl]
-        shuffle(words_transl)
-        return target_word, target_word_transl, words_transl, flag
+        query = session.query(Word)\
+                       .with_entities(Word.id_word, Word.id_type, Word.title, Word.translation)\
+                       .join(Word.study).join(User, User.id_user == Study.id_user)\
+                       .filter(User.id_chat == chat_id).filter(Study.date < date.today()).all()
+        return [tuple(word) for word in query]
 
     @staticmethod
-    def postpone_date(word_id: int) -> None:
-        '''Функция смены даты слова в таблице "study".
-           Откладывание осуществляется на 3-и дня
-        
+    def postpone_dates(chat_id: int, words_id: list) -> None:
+        '''Функция смены даты повторенных слов пользователя в таблице "study".
+           Откладывание осуществляется на 3-и дня, одной транзакцией для всех слов.
+
         '''
-        session.query(Study).filter(Study.id_word == word_id)\
+        if not words_id:
+            return
+        user_id = DBase._pulling_info_user_id(chat_id)
+        session.query(Study).filter(Study.id_user == user_id)\
+               .filter(Study.id_word.in_(words_id))\
                .update({'date': date.today() + timedelta(3)})
         session.commit()
 
@@ -110,16 +141,6 @@ class DBase:
         return session.query(Study).with_entities(Word.title, Word.translation)\
                         .join(Word.study).filter(Study.id_user == user_id).all()
 
-    @staticmethod
-    def filling_backend_info_words()-> list:
-        '''Функция выборки всех уникальных значений id_type из таблицы "word".
-           Возвращает список: [id_type, id_type,...]
-           Используется для заполнения оперативного словаря BACKEND_INFO.
-
-        '''
-        total = session.query(Word).with_entities(distinct(Word.id_type)).all()
-        return [i[0] for i in total]
-
     @staticmethod
     def filling_backend_info_users() -> dict:
         '''Функция выборки всех идентификаторов чата (id_chat) и используемого 
@@ -164,10 +185,7 @@ class DBase:
            (word_translation, word_title, [word_title,...]).
 
         '''
-        words = session.query(Word)\
-                        .with_entities(Word.title, Word.translation)\
-                        .filter(Word.id_type == choice(BACKEND_INFO['types'])).all()
-        words = sample(words, k=4)
+        words = [word[1:] for word in DBase._sampling_words(DBase._choice_type(), 4)]
         match BACKEND_INFO[chat_id]:
             case 'english':
                 target_word, *words_transl = (words[i] if not i else words[i][1] for i in range(4))
@@ -179,6 +197,22 @@ class DBase:
         shuffle(words_transl)
         return target_word, target_word_transl, words_transl
 
+    @staticmethod
+    def pull_out_inline_words_for_cards(chat_id: int) -> tuple:
+        '''Функция выборки четырех слов для inline-карточек.
+           Аналогична pull_out_words_for_cards, но возвращает идентификаторы слов,
+           необходимые для формирования подписанных данных inline-кнопок:
+           (id_word, word_title, [(id_word, word_translation),...]) или
+           (id_word, word_translation, [(id_word, word_title),...]).
+
+        '''
+        words = DBase._sampling_words(DBase._choice_type(), 4)
+        flag = 1 if BACKEND_INFO[chat_id] == 'english' else 2
+        target_word_id, target_word = words[0][0], words[0][flag]
+        options = [(word[0], word[3 - flag]) for word in words]
+        shuffle(options)
+        return target_word_id, target_word, options
+
     @staticmethod
     def add_word(target_word: str, chat_id: int) -> None:
         '''Функция добавления слова в персональный список пользователя.
@@ -244,6 +278,7 @@ class Extentions:
     en_ru_change = types.KeyboardButton('\U0001F1EC\U0001F1E7 Сменить \U0001F1F7\U0001F1FA')
     show_users_list = types.KeyboardButton('Ваши слова \U0001F9E0')
     im_ready = types.KeyboardButton('Поехали! \U0001F680')
+    finish_review = types.KeyboardButton('Завершить \U0001F3C1')
 
     @staticmethod
     def random_phrase_win() -> str:
@@ -272,68 +307,203 @@ class Extentions:
         return choice(answer_options)
 
 
+class ReviewSession:
+    '''Класс сессии повторения слов из персонального списка пользователя.
+
+       Слова для повторения выбираются одним запросом при начале сессии, варианты
+       их перевода - из словаря VOCABULARY, а даты всех повторенных
+       слов сохраняются одной транзакцией при завершении сессии.
+       Сессия без ответов пользователя в течение REVIEW_TIMEOUT секунд
+       завершается автоматически (Telebot.finish_idle_reviews).
+
+    '''
+    def __init__(self, chat_id: int) -> None:
+        self.chat_id = chat_id
+        self.due_words = DBase.pull_out_review_words(chat_id)
+        shuffle(self.due_words)
+        self.reviewed = []
+        self.touched_at = monotonic()
+
+    def is_idle(self) -> bool:
+        '''Функция проверки неактивности сессии.
+
+        '''
+        return monotonic() - self.touched_at >= REVIEW_TIMEOUT
+
+    def __len__(self) -> int:
+        return len(self.due_words)
+
+    def next_card(self) -> tuple | None:
+        '''Функция формирования следующей карточки сессии.
+           Язык целевого слова выбирается в зависимости от языка пользователя.
+           Возвращает кортеж из целевого слова, его перевода, списка из слов-вариантов перевода
+           (аналогично DBase.pull_out_words_for_cards) либо None, если слова закончились.
+
+        '''
+        if not self.due_words:
+            return None
+        word_id, type_id, *target_word = self.due_words.pop()
+        self.reviewed.append(word_id)
+        self.touched_at = monotonic()
+        flag = 0 if BACKEND_INFO[self.chat_id] == 'english' else 1
+        other_words = [word[1:] for word in DBase._sampling_words(type_id, 3, exclude=word_id)]
+        target_word, target_word_transl = target_word[flag], target_word[1 - flag]
+        words_transl = [word[1 - flag] for word in other_words] + [target_word_transl]
+        shuffle(words_transl)
+        return target_word, target_word_transl, words_transl
+
+    def finish(self) -> int:
+        '''Функция завершения сессии: откладывает даты всех показанных слов.
+           Возвращает количество повторенных слов.
+
+        '''
+        DBase.postpone_dates(self.chat_id, self.reviewed)
+        return len(self.reviewed)
+
+
 class Telebot:
     '''Статический класс для обработки сообщений Telegram-бота.
 
        Для инициализации класса необходимо в файл .config ввести имеющийся токен.
     
     '''
-    bot = TeleBot(TGBOT_TOKEN, state_storage=StateMemoryStorage())
+    bot = TeleBot(TGBOT_TOKEN, state_storage=StateMemoryStorage(), num_threads=BOT_THREADS)
+    router = Router()
+    router.middleware(error_middleware)
+    router.middleware(FloodControl(FLOOD_RATE, FLOOD_BURST, FLOOD_DUPLICATE_WINDOW,
+                                   on_drop=lambda update: Telebot.skip_update(update)))
+    chat_locks = ChatLocks()
+    router.middleware(chat_locks)
+    router.middleware(DBase.session_middleware)
+    router.middleware(timing_middleware)
+
+    @staticmethod
+    def skip_update(update) -> None:
+        '''Функция обработки обновлений, отброшенных ограничением частоты сообщений.
+           Для нажатий inline-кнопок подтверждает получение, чтобы кнопка
+           не оставалась в состоянии ожидания.
+
+        '''
+        if isinstance(update, types.CallbackQuery):
+            Telebot.bot.answer_callback_query(update.id)
 
     @staticmethod
-    @bot.message_handler(func=lambda message: message.text == Extentions.im_ready.text)
+    @router.route(Extentions.im_ready.text)
     def show_schedule_cards(message) -> None:
         '''Функция-обработчик сообщения 'Поехали! 🚀'
-           Формирует интерфейс взаимодействия с пользователем, возвращает в чат
-           карточки (составлены из целевого слова из персонального списка и 3-х случайных)
-           Обработка ответа осуществляется функцией check_response.
+           Начинает сессию повторения всех слов персонального списка пользователя,
+           которые пора повторить. Карточки сессии формируются функцией show_review_cards.
 
            Используется при подключении модуля 'notifications.py'.
 
         '''
-        info = DBase.planning_for_today()
-        if not info:
+        previous = REVIEW_SESSIONS.pop(message.chat.id, None)
+        if previous is not None:
+            previous.finish()
+        review = ReviewSession(message.chat.id)
+        if not review:
+            Telebot.bot.send_message(message.chat.id,
+                                     'Все слова из Вашего списка уже повторены \U0001F389')
+            Telebot.show_cards(message)
             return
-        for chat_id in info:
-            target_word_id = choice(info[chat_id])
-            tmp = DBase.pull_out_schedule_words_for_cards(target_word_id)
-            target_word, target_word_transl, words_transl, flag = tmp
-
-            start_cards_message = (
-                f'\U0001F1F7\U0001F1FA {target_word.upper()}'
-                if flag else
-                f'\U0001F1EC\U0001F1E7 {target_word.upper()}'
-                )
-
-            words_buttons = (types.KeyboardButton(word) for word in words_transl)
-            markup_repl = types.ReplyKeyboardMarkup(row_width=2, resize_keyboard=True)
-            markup_repl.add(*words_buttons)
-
-            markup_repl.add(Extentions.next_cards)
-            markup_repl.add(Extentions.del_word)
+        REVIEW_SESSIONS[message.chat.id] = review
+        Telebot.bot.send_message(message.chat.id,
+                                 f'Слов для повторения: {len(review)} \U0001F4DD')
+        Telebot.show_review_cards(message)
 
-            Telebot.bot.set_state(message.from_user.id,
-                                RegisterStates.target_word_transl, message.chat.id)
-            with Telebot.bot.retrieve_data(message.from_user.id, message.chat.id) as data:
-                data['target_word_transl'] = target_word_transl
-                data['target_word'] = target_word
-                data['words_transl'] = words_transl
-                data['target_word_message'] = start_cards_message
+    @staticmethod
+    def show_review_cards(message) -> None:
+        '''Функция формирования карточки сессии повторения (составлена из целевого
+           слова из персонального списка и 3-х слов той же части речи).
+           По окончании слов для повторения завершает сессию.
+           Обработка ответа осуществляется функцией check_response.
 
-            Telebot.bot.send_message(message.chat.id, start_cards_message, reply_markup=markup_repl)
-            DBase.postpone_date(target_word_id)
+        '''
+        review = REVIEW_SESSIONS.get(message.chat.id)
+        card = review.next_card() if review is not None else None
+        if card is None:
+            Telebot.finish_review(message)
+            return
+        target_word, target_word_transl, words_transl = card
+        start_cards_message = (
+            f'\U0001F1EC\U0001F1E7 {target_word.upper()}'
+            if BACKEND_INFO[message.chat.id] == 'english' else
+            f'\U0001F1F7\U0001F1FA {target_word.upper()}'
+            )
+
+        words_buttons = (types.KeyboardButton(word) for word in words_transl)
+        markup_repl = types.ReplyKeyboardMarkup(row_width=2, resize_keyboard=True)
+        markup_repl.add(*words_buttons)
+
+        markup_repl.add(Extentions.next_cards)
+        markup_repl.row(Extentions.del_word, Extentions.finish_review)
+
+        Telebot.bot.set_state(message.from_user.id,
+                              RegisterStates.target_word_transl, message.chat.id)
+        with Telebot.bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+            data['target_word_transl'] = target_word_transl
+            data['target_word'] = target_word
+            data['words_transl'] = words_transl
+            data['target_word_message'] = start_cards_message
+
+        Telebot.bot.send_message(message.chat.id, start_cards_message, reply_markup=markup_repl)
+
+    @staticmethod
+    @router.route(Extentions.finish_review.text)
+    def finish_review(message) -> None:
+        '''Функция-обработчик сообщения 'Завершить 🏁'.
+           Завершает сессию повторения: сохраняет даты повторенных слов
+           и возвращается к карточкам из случайных слов.
+
+        '''
+        review = REVIEW_SESSIONS.pop(message.chat.id, None)
+        if review is not None:
+            Telebot.bot.send_message(message.chat.id,
+                                     f'Повторение завершено, повторено слов: {review.finish()} '
+                                     '\U0001F3C6')
+        Telebot.show_cards(message)
+
+    @staticmethod
+    def finish_idle_reviews() -> None:
+        '''Функция завершения неактивных сессий повторения: сохраняет даты
+           показанных слов, чтобы они не терялись, если пользователь не вернулся к сессии.
+           Выполняется потоком ReviewReaper.
+
+        '''
+        for chat_id, review in list(REVIEW_SESSIONS.items()):
+            if not review.is_idle():
+                continue
+            with Telebot.chat_locks.hold(chat_id):
+                if REVIEW_SESSIONS.get(chat_id) is not review or not review.is_idle():
+                    continue
+                del REVIEW_SESSIONS[chat_id]
+                try:
+                    review.finish()
+                finally:
+                    session.remove()
 
     @staticmethod
-    @bot.message_handler(func=lambda message: message.text == Extentions.next_cards.text)
+    def continue_cards(message) -> None:
+        '''Функция перехода к следующей карточке: карточке сессии повторения,
+           если она начата, иначе - карточке из случайных слов.
+
+        '''
+        if message.chat.id in REVIEW_SESSIONS:
+            Telebot.show_review_cards(message)
+        else:
+            Telebot.show_cards(message)
+
+    @staticmethod
+    @router.route(Extentions.next_cards.text)
     def next_cards(message) -> None:
         '''Функция-обработчик сообщения 'Следующее ⏩'.
            Осуществляет переход к следующей карточке.
 
         '''
-        Telebot.show_cards(message)
+        Telebot.continue_cards(message)
 
     @staticmethod
-    @bot.message_handler(func=lambda message: message.text == Extentions.del_word.text)
+    @router.route(Extentions.del_word.text)
     def del_word(message) -> None:
         '''Функция-обработчик сообщения 'Удалить 🗑'..
            Удаляет целевое слово из персонального списка пользователя.
@@ -346,16 +516,16 @@ class Telebot:
         except KeyError:
             Telebot.bot.send_message(message.chat.id,
                                      'Извиняюсь, отвлекся \U0001F648')
-            Telebot.show_cards(message)
+            Telebot.continue_cards(message)
             return
         DBase.del_word(target_word, message.chat.id)
         Telebot.bot.send_message(message.chat.id,
                                     f'Слово {target_word.upper()} удалено из '
                                     'Вашего персонального списка! \U0001F4A9')
-        Telebot.show_cards(message)
+        Telebot.continue_cards(message)
 
     @staticmethod
-    @bot.message_handler(func=lambda message: message.text == Extentions.add_word.text)
+    @router.route(Extentions.add_word.text)
     def add_word(message) -> None:
         '''Функция-обработчик сообщения 'Добавить ➕'.
            Добавляет целевое слово в персональный список пользователя.
@@ -389,7 +559,7 @@ class Telebot:
         Telebot.show_cards(message)
 
     @staticmethod
-    @bot.message_handler(func=lambda message: message.text == Extentions.show_users_list.text)
+    @router.route(Extentions.show_users_list.text)
     def show_users_word(message) -> None:
         '''Функция-обработчик сообщения 'Ваши слова 🧠'.
            Возвращает в чат слова из персонального списка пользователя.
@@ -411,8 +581,7 @@ class Telebot:
                                      'В настоящий момент Ваш персональный список пуст \U0001F573')
 
     @staticmethod
-    @bot.message_handler(func=lambda message: message.text
-                         in (Extentions.ru_en_change.text, Extentions.en_ru_change.text))
+    @router.route(Extentions.ru_en_change.text, Extentions.en_ru_change.text)
     def change_language(message) -> None:
         '''Функция-обработчик сообщений 'RU Сменить EN' и 'EN Сменить RU'.
            Меняет язык отображаемых в чате карточек.
@@ -422,7 +591,7 @@ class Telebot:
         Telebot.show_cards(message)
 
     @staticmethod
-    @bot.message_handler(commands=['start'])
+    @router.route('/start')
     def show_greeting(message) -> None:
         '''Функция-обработчик команды /start.
            Выполняет регистрацию, возвращает в чат приветствие пользователя.
@@ -453,7 +622,7 @@ class Telebot:
         Telebot.bot.send_message(message.chat.id, faq_message, reply_markup=markup_repl)
 
     @staticmethod
-    @bot.message_handler(commands=['help'])
+    @router.route('/help')
     def show_help(message) -> None:
         '''Функция-обработчик команды /help.
            Возвращает в чат информацию о функционале Telegram-бота.
@@ -468,8 +637,8 @@ class Telebot:
             'в данный момент слов. Если в процессе обучения Вы наткнетесь на незнакомое слово '
             '\U0001F92F, Вы можете добавить (\U0001F4CCДобавить) его в персональный список (или '
             'нажать (\U0001F4CCСледующее)). При наличии слов в списке, Вам будут высылаться уведо'
-            'мления для их повторения: одно случайное слово раз в день. Одно то же слово не будет'
-            ' повторяться чаще одного раза в 4-е дня.'
+            'мления для их повторения: раз в день все слова, которые пора повторить. Одно и то же '
+            'слово не будет повторяться чаще одного раза в 4-е дня.'
             'Если в процессе обучения Вам повторно попадется слово, находящееся в Вашем персонал'
             'ьном списке, у Вас появится возможность его удалить из него (\U0001F4CCУдалить). '
             'При очень большом желании я также могу показать все изучаемые Вами в данный'
@@ -482,7 +651,7 @@ class Telebot:
         Telebot.bot.send_message(message.chat.id, help_message, reply_markup=markup_repl)
 
     @staticmethod
-    @bot.message_handler(commands=['cards'])
+    @router.route('/cards')
     def show_cards(message) -> None:
         '''Функция-обработчик команды /cards.
            Формирует интерфейс взаимодействия с пользователем, 
@@ -524,7 +693,7 @@ class Telebot:
         Telebot.bot.send_message(message.chat.id, start_cards_message, reply_markup=markup_repl)
 
     @staticmethod
-    @bot.message_handler(content_types=['text'])
+    @router.fallback
     def check_response(message) -> None:
         '''Функция-обработчик любых текстовых сообщений. 
            Осуществляет проверку ответа пользователя на сгенерированнуе в функциях
@@ -541,13 +710,13 @@ class Telebot:
         except KeyError:
             Telebot.bot.send_message(message.chat.id,
                                      'Простите, уснул \U0001F4A4 , продолжаем...')
-            Telebot.show_cards(message)
+            Telebot.continue_cards(message)
             return
         if user_word in words_transl:
             if target_word_transl == user_word:
                 Telebot.bot.send_message(message.chat.id,
                                         Extentions.random_phrase_win())
-                Telebot.show_cards(message)
+                Telebot.continue_cards(message)
             else:
                 Telebot.bot.send_message(message.chat.id,
                                         Extentions.random_phrase_lose())
@@ -558,15 +727,181 @@ class Telebot:
                                      'вариантов \U0001F9CF')
             Telebot.bot.send_message(message.chat.id, start_cards_message)
 
+    @staticmethod
+    def send_inline_cards(chat_id: int) -> None:
+        '''Функция формирования inline-карточки (составлена из 4-х случайных слов).
+           Данные каждой кнопки содержат подписанное время формирования карточки,
+           а кнопки-варианта - также идентификаторы целевого слова и варианта ответа,
+           поэтому ответ проверяется функцией check_inline_response без обращения
+           к хранилищу состояний.
+
+        '''
+        target_word_id, target_word, options = DBase.pull_out_inline_words_for_cards(chat_id)
+        start_cards_message = (
+            f'\U0001F1EC\U0001F1E7 {target_word.upper()}'
+            if BACKEND_INFO[chat_id] == 'english' else
+            f'\U0001F1F7\U0001F1FA {target_word.upper()}'
+            )
+
+        issued = CallbackData.issued_now()
+        words_buttons = (
+            types.InlineKeyboardButton(
+                word, callback_data=CallbackData.pack_option(chat_id, target_word_id,
+                                                             option_id, issued))
+            for option_id, word in options
+            )
+        markup_inl = types.InlineKeyboardMarkup(row_width=2)
+        markup_inl.add(*words_buttons)
+        markup_inl.add(types.InlineKeyboardButton(Extentions.next_cards.text,
+                                                  callback_data=CallbackData.pack_next_card(
+                                                      chat_id, issued)))
+
+        Telebot.bot.send_message(chat_id, start_cards_message, reply_markup=markup_inl)
+
+    @staticmethod
+    @router.route('/inline')
+    def show_inline_cards(message) -> None:
+        '''Функция-обработчик команды /inline.
+           Возвращает в чат inline-карточку.
+           Обработка ответа осуществляется функцией check_inline_response.
+
+        '''
+        Telebot.send_inline_cards(message.chat.id)
+
+    @staticmethod
+    def check_inline_response(call) -> None:
+        '''Функция-обработчик нажатий кнопок inline-карточек.
+           Проверяет подпись данных кнопки, срок действия карточки (INLINE_CARD_TTL)
+           и правильность ответа пользователя без обращения к хранилищу состояний.
+           Возвращает уведомление о результатах выполнения.
+
+        '''
+        chat_id = call.message.chat.id
+        if call.data.startswith(NEXT_CARD + SEPARATOR):
+            issued = CallbackData.unpack_next_card(chat_id, call.data)
+            option = None
+        else:
+            option = CallbackData.unpack_option(chat_id, call.data)
+            issued = option[2] if option is not None else None
+        if issued is None:
+            Telebot.bot.answer_callback_query(call.id, 'Не удалось проверить ответ \U0001F9D0')
+            return
+        if CallbackData.is_expired(issued, INLINE_CARD_TTL):
+            Telebot.bot.answer_callback_query(call.id, 'Эта карточка устарела \U0001F9D0')
+            Telebot.bot.edit_message_reply_markup(chat_id, call.message.message_id)
+            return
+        if option is None:
+            Telebot.bot.answer_callback_query(call.id)
+            Telebot.bot.edit_message_reply_markup(chat_id, call.message.message_id)
+            Telebot.send_inline_cards(chat_id)
+            return
+        target_word_id, option_id, _ = option
+        if option_id == target_word_id:
+            Telebot.bot.answer_callback_query(call.id, Extentions.random_phrase_win())
+            Telebot.bot.edit_message_reply_markup(chat_id, call.message.message_id)
+            Telebot.send_inline_cards(chat_id)
+        else:
+            Telebot.bot.answer_callback_query(call.id, Extentions.random_phrase_lose())
+
+    @staticmethod
+    @bot.callback_query_handler(func=lambda call: True)
+    def dispatch_callback(call) -> None:
+        '''Единственная функция-обработчик нажатий inline-кнопок Telegram-бота.
+           Передает нажатие функции check_inline_response через цепочку middleware.
+
+        '''
+        Telebot.router.run(Telebot.check_inline_response, call)
+
+    @staticmethod
+    @bot.message_handler(content_types=['text'])
+    def dispatch(message) -> None:
+        '''Единственная функция-обработчик текстовых сообщений Telegram-бота.
+           Передает сообщение маршрутизатору, который выбирает обработчик
+           по точному тексту сообщения (кнопки, команды) либо check_response.
+
+        '''
+        Telebot.router.dispatch(message)
+
+
+class ReviewReaper(threading.Thread):
+    '''Класс фонового потока, завершающего неактивные сессии повторения
+       (Telebot.finish_idle_reviews). Поток ожидает истечения REVIEW_TIMEOUT
+       сессии с наиболее давним ответом пользователя, поэтому сессии завершаются
+       вскоре после истечения времени неактивности.
+
+    '''
+    # Минимальная пауза (в секундах) между проверками сессий
+    MIN_DELAY = 1.0
+
+    def __init__(self) -> None:
+        super().__init__(name='review-reaper', daemon=True)
+        self.stopped = threading.Event()
+
+    def delay(self) -> float:
+        '''Функция расчета времени (в секундах) до истечения REVIEW_TIMEOUT
+           ближайшей сессии, либо REVIEW_TIMEOUT при отсутствии сессий.
+
+        '''
+        touched_at = min((review.touched_at for review in list(REVIEW_SESSIONS.values())),
+                         default=monotonic())
+        return max(touched_at + REVIEW_TIMEOUT - monotonic(), self.MIN_DELAY)
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.delay()):
+            try:
+                Telebot.finish_idle_reviews()
+            except Exception:
+                logger.exception('Ошибка завершения неактивных сессий повторения')
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+
+def startup() -> tuple:
+    '''Функция подготовки Telegram-бота к работе: загружает словарь
+       и заполняет оперативный словарь BACKEND_INFO.
+       Возвращает запущенные фоновые потоки: (VocabularyWatcher, ReviewReaper)
+
+    '''
+    global VOCABULARY
+    if os.path.exists(VOCABULARY_PATH):
+        VOCABULARY = VocabularySnapshot(VOCABULARY_PATH)
+    else:
+        VOCABULARY = VocabularyCache()
+    workers = VocabularyWatcher(VOCABULARY), ReviewReaper()
+    for worker in workers:
+        worker.start()
+    BACKEND_INFO.update(DBase.filling_backend_info_users())
+    return workers
+
+
+def shutdown(workers: tuple) -> None:
+    '''Функция завершения работы Telegram-бота: останавливает фоновые потоки (startup),
+       сохраняет начатые сессии повторения и закрывает сессию подключения к базе данных.
+       Ошибка сохранения одной сессии записывается в лог и не прерывает сохранение остальных.
+
+    '''
+    for worker in workers:
+        worker.stop()
+    for worker in workers:
+        worker.join()
+    try:
+        while REVIEW_SESSIONS:
+            chat_id, review = REVIEW_SESSIONS.popitem()
+            try:
+                review.finish()
+            except Exception:
+                logger.exception('Ошибка сохранения сессии повторения чата %s', chat_id)
+    finally:
+        session.remove()
+
 
 if __name__ == '__main__':
-    session = DBaseConfig.Session()
-    BACKEND_INFO = DBase.filling_backend_info_users()
-    BACKEND_INFO['types'] = DBase.filling_backend_info_words()
+    workers = startup()
     try:
         print('Bot is running...')
         Telebot.bot.infinity_polling(skip_pending=True)
     finally:
         print('Bot stopped.')
-        session.close()
+        shutdown(workers)
         print('Session closed.')
@@ -5,6 +5,7 @@
 '''
 import os
 import sqlite3
+from itertools import chain
 
 import sqlalchemy as sqla
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
@@ -25,9 +26,35 @@ class DBaseConfig:
     @staticmethod
     def create_table(engine):
         '''Функция создания таблиц, по описанным моделям.
+           В базе данных, созданной до появления счетчиков изменений словаря,
+           также добавляет столбец "version" в таблицу "word" и заполняет таблицу "version".
 
         '''
         DBaseConfig.Base.metadata.create_all(engine)
+        columns = {column['name'] for column in sqla.inspect(engine).get_columns('word')}
+        with engine.begin() as connection:
+            if 'version' not in columns:
+                connection.execute(sqla.text(
+                    'ALTER TABLE word ADD COLUMN version INTEGER NOT NULL DEFAULT 0'))
+                for index in Word.__table__.indexes:
+                    index.create(connection, checkfirst=True)
+            existing = {title for title, in connection.execute(sqla.select(Version.title))}
+            for title in {'word', 'type'} - existing:
+                connection.execute(sqla.insert(Version).values(title=title, value=0))
+
+    @staticmethod
+    def bump_version(session, title: str) -> int:
+        '''Функция увеличения счетчика изменений таблицы title ("word" либо "type").
+           Выполняется в транзакции изменения таблицы: параллельные изменения
+           ожидают ее завершения, поэтому номера версий фиксируются по порядку.
+           Возвращает новое значение счетчика.
+
+        '''
+        updated = session.execute(sqla.update(Version).where(Version.title == title)
+                                  .values(value=Version.value + 1))
+        if not updated.rowcount:
+            session.execute(sqla.insert(Version).values(title=title, value=1))
+        return session.scalar(sqla.select(Version.value).where(Version.title == title))
 
     @staticmethod
     def delete_table(engine):
@@ -54,6 +81,8 @@ class DBaseConfig:
         '''Функция заполнения таблицы "word".
            Заполнение осуществляется данными из .txt файла, 
            формата: 'часть речи';'слово';'перевод'.
+           Слова, уже имеющиеся в таблице, пропускаются, поэтому для добавления
+           новых слов достаточно дописать их в файл и повторно запустить функцию.
 
         '''
         file_path = os.path.join(os.getcwd(), 'data', 'all_words.txt')
@@ -62,8 +91,11 @@ class DBaseConfig:
         with DBaseConfig.Session() as session:
             types = session.query(Type.id_type, Type.title).all()
             types = {title: id_type for id_type, title in types}
+            existing = {title for title, in session.query(Word.title).all()}
             for line in data:
                 id_type, title, translation = line.rstrip().split(';')
+                if title in existing:
+                    continue
                 model = Word(id_type=types[id_type] , title=title, translation=translation)
                 session.add(model)
             session.commit()
@@ -88,8 +120,9 @@ class Type(DBaseConfig.Base):
 class Word(DBaseConfig.Base):
     '''Модель таблицы "word"
 
-       Хранит идентификатор, английское слово, его перевод и 
-       ссылку на часть речи, к которому принадлежит
+       Хранит идентификатор, английское слово, его перевод,
+       ссылку на часть речи, к которому принадлежит, и номер версии
+       таблицы "version", в которой слово было добавлено или изменено.
        По принципу "один ко многим" связана с "type"
        По принципу "один ко многим" связана с "study"
 
@@ -100,6 +133,7 @@ class Word(DBaseConfig.Base):
     id_type = sqla.Column(sqla.Integer, sqla.ForeignKey(Type.id_type), nullable=False)
     title = sqla.Column(sqla.String(length=20), unique=True, nullable=False)
     translation = sqla.Column(sqla.String(length=20), nullable=True)
+    version = sqla.Column(sqla.Integer, nullable=False, default=0, server_default='0', index=True)
 
     type = relationship('Type', back_populates='word')
     study = relationship('Study', back_populates='word')
@@ -140,6 +174,58 @@ class Study(DBaseConfig.Base):
     word = relationship('Word', back_populates='study')
     user = relationship('User', back_populates='study')
 
+class Version(DBaseConfig.Base):
+    '''Модель таблицы "version"
+
+       Хранит счетчики изменений таблиц "word" и "type". Счетчик увеличивается
+       при каждом изменении таблицы через сессию DBaseConfig.Session (в том числе
+       функциями filling_out_type, filling_out_word), что позволяет перезагружать
+       словарь работающего Telegram-бота только при его изменении.
+
+    '''
+    __tablename__ = 'version'
+
+    title = sqla.Column(sqla.String(length=20), primary_key=True)
+    value = sqla.Column(sqla.Integer, nullable=False)
+
+
+@sqla.event.listens_for(DBaseConfig.Session, 'before_flush')
+def _bumping_version_on_flush(session, flush_context, instances):
+    '''Функция-обработчик сохранения объектов сессии: при изменении
+       слов или частей речи увеличивает счетчик изменений и отмечает
+       добавленные и измененные слова новым номером версии.
+
+    '''
+    changed = [model for model in chain(session.new, session.dirty, session.deleted)
+               if isinstance(model, (Word, Type)) and
+               (model in session.new or model in session.deleted or session.is_modified(model))]
+    if any(isinstance(model, Type) for model in changed):
+        DBaseConfig.bump_version(session, 'type')
+    if any(isinstance(model, Word) for model in changed):
+        version = DBaseConfig.bump_version(session, 'word')
+        for model in changed:
+            if isinstance(model, Word) and model not in session.deleted:
+                model.version = version
+
+
+@sqla.event.listens_for(DBaseConfig.Session, 'do_orm_execute')
+def _bumping_version_on_execute(state):
+    '''Функция-обработчик массовых изменений (query.update, query.delete)
+       таблиц "word" и "type": увеличивает счетчик изменений,
+       обновленные слова отмечаются новым номером версии.
+
+    '''
+    if not (state.is_update or state.is_delete) or state.bind_mapper is None:
+        return
+    model = state.bind_mapper.class_
+    if model is Type:
+        DBaseConfig.bump_version(state.session, 'type')
+    elif model is Word:
+        version = DBaseConfig.bump_version(state.session, 'word')
+        if state.is_update:
+            state.statement = state.statement.values(version=version)
+
+
 # Для создания таблиц по вышеописанным моделям и заполнения их данными,
 # необходимо раскомментировать и запустить код ниже.
 
@@ -3,16 +3,27 @@
 находящихся у него в персональном списке.
 
 '''
+import logging
+import threading
 from datetime import date
-from time import sleep
 
-from schedule import repeat, run_pending, every
+from schedule import every, idle_seconds, repeat, run_pending
 from telebot import types, TeleBot
 from sqlalchemy import distinct, func
 
 from models import DBaseConfig, Study, User
 from config import TGBOT_TOKEN
 
+logger = logging.getLogger(__name__)
+
+# Пауза (в секундах) планировщика после ошибки выполнения задания
+RETRY_DELAY = 60
+
+# BOT - экземпляр Telegram-бота для рассылки уведомлений.
+# Создается при первой рассылке; при запуске уведомлений в одном процессе
+# с основным модулем (модуль 'runtime.py') используется экземпляр основного модуля.
+BOT = None
+
 def check_in() -> list:
     '''Функция выборки информации о пользователях (chat_id).
        Выборка осуществляется по дате ('date') таблицы "study": дата меньше текущей.
@@ -21,7 +32,7 @@ def check_in() -> list:
     '''
     with DBaseConfig.Session() as session:
         query = session.query(Study).with_entities(distinct(User.id_chat))\
-                        .join(User.study).filter(Study.date < date.today()).group_by.all()
+                        .join(User.study).filter(Study.date < date.today()).all()
     return [chat_id[0] for chat_id in query] if query else None
 
 
@@ -29,9 +40,13 @@ def activate_notifications() -> None:
     '''Функция рассылки уведомлений о повторении слов, 
        находящиеся в персональном списке пользователя и
        соответствующие условию: добавлены в персональный список ранее текущей даты.
+       Ошибка отправки уведомления одному пользователю (например, заблокировавшему
+       бота) записывается в лог и не прерывает рассылку остальным.
 
     '''
-    bot = TeleBot(TGBOT_TOKEN)
+    global BOT
+    if BOT is None:
+        BOT = TeleBot(TGBOT_TOKEN)
     plan = check_in()
     if not plan:
         return
@@ -39,8 +54,12 @@ def activate_notifications() -> None:
         im_ready_button = types.KeyboardButton('Поехали! \U0001F680')
         markup_repl = types.ReplyKeyboardMarkup(row_width=1, resize_keyboard=True)
         markup_repl.add(im_ready_button)
-        notification_message = 'Пришло время повторить слово из Вашего списка \U0001F556'
-        bot.send_message(chat_id, notification_message, reply_markup=markup_repl)
+        notification_message = ('Пришло время повторить слова из Вашего списка \U0001F556\n'
+                                '\U0001F680 - все слова, которые пора повторить, в одной сессии')
+        try:
+            BOT.send_message(chat_id, notification_message, reply_markup=markup_repl)
+        except Exception:
+            logger.exception('Ошибка отправки уведомления в чат %s', chat_id)
 
 
 # Декоратор настоен на запуск функции notification ежедневно в 19.00
@@ -52,16 +71,37 @@ def activate_notifications() -> None:
 def notifications():
     '''Функция-таймер.
        Запускает скрипт рассылки уведомлений по расписанию.
+       Ошибка рассылки записывается в лог, следующая рассылка выполняется по расписанию.
+
+    '''
+    try:
+        activate_notifications()
+    except Exception:
+        logger.exception('Ошибка рассылки уведомлений')
+
+
+def run_scheduler(stopped: threading.Event) -> None:
+    '''Функция-планировщик.
+       Ожидает ближайшую по расписанию рассылку (либо события stopped)
+       и запускает ее, без периодического опроса расписания.
+       Ошибка выполнения задания записывается в лог и не останавливает планировщик.
 
     '''
-    activate_notifications()
+    while not stopped.is_set():
+        idle = idle_seconds()
+        stopped.wait(None if idle is None else max(idle, 0))
+        if stopped.is_set():
+            break
+        try:
+            run_pending()
+        except Exception:
+            logger.exception('Ошибка выполнения задания планировщика')
+            stopped.wait(RETRY_DELAY)
 
 
 if __name__ == '__main__':
     print('Notifications are running...')
     try:
-        while True:
-            run_pending()
-            sleep(1)
+        run_scheduler(threading.Event())
     finally:
         print('Notifications stopped.')
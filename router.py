@@ -0,0 +1,211 @@
+'''
+Модуль маршрутизации сообщений Telegram-бота.
+
+Сообщения-кнопки и команды распределяются по функциям-обработчикам
+одним обращением к словарю по точному тексту сообщения,
+вокруг обработчиков выстраивается цепочка промежуточных функций (middleware).
+
+'''
+import logging
+import threading
+from contextlib import contextmanager
+from functools import partial
+from time import monotonic, perf_counter
+
+logger = logging.getLogger(__name__)
+
+
+def chat_id_of(update) -> int:
+    '''Функция выборки идентификатора чата (chat_id) из входящего обновления:
+       сообщения (Message) либо нажатия inline-кнопки (CallbackQuery).
+
+    '''
+    message = getattr(update, 'message', None) or update
+    return message.chat.id
+
+
+class Router:
+    '''Класс маршрутизатора сообщений.
+
+       Хранит словарь {текст сообщения: функция-обработчик}, функцию-обработчик
+       по умолчанию (для сообщений, отсутствующих в словаре) и список middleware.
+       Middleware - функция вида middleware(handler, update), которая должна
+       вызвать handler(update) для передачи обновления дальше по цепочке.
+
+    '''
+    def __init__(self) -> None:
+        self.routes = {}
+        self.middlewares = []
+        self.default = None
+
+    def route(self, *keys: str):
+        '''Функция-декоратор регистрации обработчика для сообщений
+           с текстом из keys (текст кнопки либо команда вида '/start').
+
+        '''
+        def decorator(handler):
+            for key in keys:
+                self.routes[key] = handler
+            return handler
+        return decorator
+
+    def fallback(self, handler):
+        '''Функция-декоратор регистрации обработчика по умолчанию.
+
+        '''
+        self.default = handler
+        return handler
+
+    def middleware(self, middleware):
+        '''Функция-декоратор регистрации middleware.
+           Первая зарегистрированная middleware является внешней в цепочке.
+
+        '''
+        self.middlewares.append(middleware)
+        return middleware
+
+    def resolve(self, text: str):
+        '''Функция выбора обработчика по тексту сообщения.
+           Для команд отбрасываются аргументы и упоминание бота (/cards@bot_name).
+
+        '''
+        if text and text.startswith('/'):
+            text = text.split(maxsplit=1)[0].split('@', 1)[0]
+        return self.routes.get(text, self.default)
+
+    def run(self, handler, update) -> None:
+        '''Функция вызова обработчика через цепочку middleware.
+
+        '''
+        call = handler
+        for middleware in reversed(self.middlewares):
+            call = partial(middleware, call)
+        call(update)
+
+    def dispatch(self, message) -> None:
+        '''Функция-обработчик входящего сообщения:
+           выбирает обработчик и вызывает его через цепочку middleware.
+
+        '''
+        handler = self.resolve(message.text)
+        if handler is not None:
+            self.run(handler, message)
+
+
+def error_middleware(handler, update) -> None:
+    '''Middleware обработки ошибок.
+       Исключение обработчика записывается в лог и не останавливает работу бота.
+
+    '''
+    try:
+        handler(update)
+    except Exception:
+        logger.exception('Ошибка обработки обновления чата %s', chat_id_of(update))
+
+
+def timing_middleware(handler, update) -> None:
+    '''Middleware замера времени выполнения обработчика.
+
+    '''
+    start = perf_counter()
+    try:
+        handler(update)
+    finally:
+        logger.debug('%s: %.1f мс', getattr(handler, '__name__', handler),
+                     (perf_counter() - start) * 1000)
+
+
+class ChatLocks:
+    '''Класс блокировок по идентификатору чата.
+       Обновления одного чата обрабатываются последовательно,
+       обновления разных чатов - параллельно.
+       Блокировка чата хранится, пока ее удерживает либо ожидает хотя бы один поток.
+
+    '''
+    def __init__(self) -> None:
+        self._guard = threading.Lock()
+        # {chat_id: [блокировка, количество удерживающих и ожидающих потоков]}
+        self._locks = {}
+
+    @contextmanager
+    def hold(self, chat_id: int):
+        '''Контекстный менеджер блокировки чата chat_id.
+
+        '''
+        with self._guard:
+            entry = self._locks.setdefault(chat_id, [threading.RLock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[chat_id]
+
+    def __call__(self, handler, update) -> None:
+        with self.hold(chat_id_of(update)):
+            handler(update)
+
+
+class FloodControl:
+    '''Класс-middleware ограничения частоты обновлений по идентификатору чата.
+
+       Для каждого чата ведется "корзина токенов": обновление обрабатывается, если
+       в корзине есть токен, корзина пополняется на rate токенов в секунду до burst.
+       Обновление, повторяющее предыдущее обновление чата (тот же текст сообщения
+       либо те же данные inline-кнопки) в течение window секунд, отбрасывается.
+       Для отброшенных обновлений вызывается функция on_drop(update).
+
+    '''
+    def __init__(self, rate: float, burst: int, window: float, on_drop=None) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.window = window
+        self.on_drop = on_drop
+        self._guard = threading.Lock()
+        # {chat_id: [количество токенов, время пополнения, ключ последнего обновления, время]}
+        self._chats = {}
+        self._swept_at = monotonic()
+        # Через idle секунд без обновлений корзина чата полна, а повтор невозможен:
+        # запись о чате не отличается от новой и может быть удалена
+        self.idle = max(window, burst / rate)
+
+    def _sweep(self, now: float) -> None:
+        '''Функция удаления записей о чатах без обновлений в течение idle секунд.
+           Выполняется не чаще одного раза в idle секунд.
+
+        '''
+        if now - self._swept_at < self.idle:
+            return
+        self._swept_at = now
+        self._chats = {chat_id: chat for chat_id, chat in self._chats.items()
+                       if now - chat[1] < self.idle}
+
+    def allow(self, update) -> bool:
+        '''Функция проверки допустимости обработки обновления.
+
+        '''
+        key = getattr(update, 'data', None) or getattr(update, 'text', None)
+        now = monotonic()
+        with self._guard:
+            self._sweep(now)
+            chat = self._chats.setdefault(chat_id_of(update), [self.burst, now, None, 0.0])
+            tokens, refilled_at, last_key, last_at = chat
+            if key is not None and key == last_key and now - last_at < self.window:
+                return False
+            tokens = min(self.burst, tokens + (now - refilled_at) * self.rate)
+            if tokens < 1:
+                chat[:2] = tokens, now
+                return False
+            chat[:] = tokens - 1, now, key, now
+            return True
+
+    def __call__(self, handler, update) -> None:
+        if self.allow(update):
+            handler(update)
+            return
+        logger.debug('Обновление чата %s отброшено', chat_id_of(update))
+        if self.on_drop is not None:
+            self.on_drop(update)
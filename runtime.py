@@ -0,0 +1,43 @@
+'''
+Модуль запуска Telegram-бота и рассылки уведомлений в одном процессе.
+
+Функции-обработчики основного модуля 'main.py' и планировщик модуля 'notifications.py'
+используют общие пул подключений к базе данных, экземпляр Telegram-бота
+и HTTP-сессию к его API.
+
+'''
+import threading
+
+import requests
+from telebot import apihelper
+
+import main
+import notifications
+
+
+def run() -> None:
+    '''Функция запуска Telegram-бота вместе с планировщиком уведомлений.
+       Планировщик работает в отдельном потоке и останавливается вместе с ботом.
+
+    '''
+    # Одна HTTP-сессия (и пул соединений) для всех потоков, обращающихся к API Telegram
+    apihelper.session = requests.Session()
+    notifications.BOT = main.Telebot.bot
+    workers = main.startup()
+    stopped = threading.Event()
+    scheduler = threading.Thread(target=notifications.run_scheduler, args=(stopped,),
+                                 name='notifications', daemon=True)
+    scheduler.start()
+    try:
+        print('Bot and notifications are running...')
+        main.Telebot.bot.infinity_polling(skip_pending=True)
+    finally:
+        stopped.set()
+        scheduler.join()
+        print('Bot and notifications stopped.')
+        main.shutdown(workers)
+        print('Session closed.')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,335 @@
+'''
+Модуль словаря (таблицы "word"): снимок для совместного использования
+несколькими процессами Telegram-бота и перезагрузка словаря без перезапуска бота.
+
+Снимок - двоичный файл только для чтения, который каждый процесс открывает через mmap:
+операционная система хранит одну физическую копию файла для всех процессов,
+а открытие снимка не требует запросов к базе данных.
+
+Формат файла (целые числа - беззнаковые 32-битные, little-endian):
+    заголовок:        magic, версия формата, количество частей речи, количество слов,
+                      счетчики изменений таблиц "word" и "type" (таблица "version")
+    таблица типов:    [id_type, индекс первого слова типа, количество слов типа] * n_types
+    таблица слов:     [id_word, id_type, смещение title, длина title,
+                       смещение translation, длина translation] * n_words,
+                      слова упорядочены по (id_type, id_word)
+    индекс слов:      [id_word, индекс слова в таблице слов] * n_words,
+                      упорядочен по id_word
+    строки:           title и translation в кодировке UTF-8, смещения отсчитываются
+                      от начала блока строк
+
+'''
+import logging
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left
+from random import sample
+from time import monotonic
+
+from sqlalchemy import func
+
+from config import VOCABULARY_PATH
+from models import DBaseConfig, Version, Word
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'VOCB'
+FORMAT_VERSION = 2
+
+HEADER = struct.Struct('<4sIIIII')
+TYPE_RECORD = struct.Struct('<III')
+WORD_RECORD = struct.Struct('<IIIIII')
+INDEX_RECORD = struct.Struct('<II')
+
+
+class VocabularySnapshot:
+    '''Класс доступа к снимку словаря.
+
+       Файл снимка открывается через mmap, строки декодируются только при обращении.
+       Публикация нового снимка (VocabularySnapshot.publish) атомарно заменяет файл,
+       открытые снимки перечитывают его не чаще одного раза в check_interval секунд.
+
+    '''
+    def __init__(self, path: str = VOCABULARY_PATH, check_interval: float = 5.0) -> None:
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked_at = monotonic()
+        self._state = self._load(path)
+
+    @staticmethod
+    def _load(path: str) -> tuple:
+        '''Функция открытия файла снимка.
+           Возвращает кортеж: (идентификатор файла, mmap, memoryview, {id_type: (начало, количество)},
+           количество слов, смещение таблицы слов, смещение индекса, смещение строк,
+           (счетчики изменений таблиц "word" и "type"), по которым сформирован снимок).
+
+        '''
+        with open(path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        magic, version, n_types, n_words, *versions = HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f'{path}: неподдерживаемый формат снимка словаря')
+        types_offset = HEADER.size
+        words_offset = types_offset + n_types * TYPE_RECORD.size
+        index_offset = words_offset + n_words * WORD_RECORD.size
+        strings_offset = index_offset + n_words * INDEX_RECORD.size
+        types = {}
+        for i in range(n_types):
+            id_type, start, count = TYPE_RECORD.unpack_from(view, types_offset + i * TYPE_RECORD.size)
+            types[id_type] = (start, count)
+        file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        return (file_id, mapped, view, types, n_words, words_offset, index_offset, strings_offset,
+                tuple(versions))
+
+    def outdated(self) -> bool:
+        '''Функция проверки изменений словаря в базе данных после формирования снимка.
+
+        '''
+        with DBaseConfig.Session() as session:
+            return pulling_versions(session) != self._state[8]
+
+    def refresh(self, force: bool = False) -> bool:
+        '''Функция проверки публикации нового снимка.
+           При замене файла открывает новый снимок и атомарно подменяет текущий.
+           Возвращает True, если снимок был перечитан.
+
+        '''
+        now = monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return False
+        with self._lock:
+            self._checked_at = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return False
+            if (stat.st_ino, stat.st_mtime_ns, stat.st_size) == self._state[0]:
+                return False
+            self._state = self._load(self.path)
+            return True
+
+    def types(self) -> list:
+        '''Функция выборки всех частей речи, к которым относятся слова снимка.
+           Возвращает список: [id_type, id_type,...]
+
+        '''
+        self.refresh()
+        return list(self._state[3])
+
+    def sample_words(self, type_id: int, k: int, exclude: int | None = None) -> list:
+        '''Функция случайной выборки k слов заданной части речи (кроме слова exclude).
+           Декодируются только выбранные записи снимка.
+           Возвращает список: [(id_word, word_title, word_translation),...]
+
+        '''
+        self.refresh()
+        state = self._state
+        start, count = state[3].get(type_id, (0, 0))
+        positions = sample(range(start, start + count), k=min(k + (exclude is not None), count))
+        words = (self._unpack_record(state, i) for i in positions)
+        return [(id_word, title, translation)
+                for id_word, _, title, translation in words if id_word != exclude][:k]
+
+    def word(self, word_id: int) -> tuple | None:
+        '''Функция выборки слова по идентификатору (двоичный поиск по индексу слов).
+           Возвращает кортеж (id_word, id_type, word_title, word_translation) либо None.
+
+        '''
+        self.refresh()
+        state = self._state
+        _, _, view, _, n_words, _, index_offset, _, _ = state
+        ids = _IndexColumn(view, index_offset, n_words)
+        position = bisect_left(ids, word_id)
+        if position == n_words or ids[position] != word_id:
+            return None
+        _, i = INDEX_RECORD.unpack_from(view, index_offset + position * INDEX_RECORD.size)
+        return self._unpack_record(state, i)
+
+    def __len__(self) -> int:
+        return self._state[4]
+
+    @staticmethod
+    def _unpack_record(state: tuple, i: int) -> tuple:
+        '''Функция чтения i-й записи таблицы слов.
+           Возвращает кортеж (id_word, id_type, word_title, word_translation).
+
+        '''
+        view, words_offset, strings_offset = state[2], state[5], state[7]
+        id_word, id_type, title_off, title_len, transl_off, transl_len = \
+            WORD_RECORD.unpack_from(view, words_offset + i * WORD_RECORD.size)
+        title = str(view[strings_offset + title_off:strings_offset + title_off + title_len],
+                    'utf-8')
+        translation = str(view[strings_offset + transl_off:strings_offset + transl_off + transl_len],
+                          'utf-8')
+        return id_word, id_type, title, translation
+
+    @staticmethod
+    def publish(path: str = VOCABULARY_PATH) -> int:
+        '''Функция формирования снимка словаря по данным таблицы "word".
+           В заголовок снимка записываются счетчики изменений словаря.
+           Снимок записывается во временный файл, который затем атомарно
+           заменяет опубликованный (os.replace).
+           Возвращает количество слов в снимке.
+
+        '''
+        with DBaseConfig.Session() as session:
+            versions = pulling_versions(session)
+            words = session.query(Word)\
+                           .with_entities(Word.id_word, Word.id_type, Word.title, Word.translation)\
+                           .order_by(Word.id_type, Word.id_word).all()
+        types, records, strings, size = {}, [], [], 0
+        for i, (id_word, id_type, title, translation) in enumerate(words):
+            start, count = types.get(id_type, (i, 0))
+            types[id_type] = (start, count + 1)
+            title, translation = title.encode(), (translation or '').encode()
+            records.append((id_word, id_type, size, len(title),
+                            size + len(title), len(translation)))
+            strings += (title, translation)
+            size += len(title) + len(translation)
+        index = sorted((record[0], i) for i, record in enumerate(records))
+
+        # Временный файл уникален для процесса: снимок могут публиковать несколько процессов
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(types), len(records), *versions))
+            for id_type, (start, count) in types.items():
+                file.write(TYPE_RECORD.pack(id_type, start, count))
+            for record in records:
+                file.write(WORD_RECORD.pack(*record))
+            for record in index:
+                file.write(INDEX_RECORD.pack(*record))
+            file.writelines(strings)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+        return len(records)
+
+
+class VocabularyCache:
+    '''Класс словаря, хранящегося в памяти процесса и перечитываемого
+       из базы данных без перезапуска Telegram-бота.
+
+       Изменения определяются по счетчикам изменений таблиц "word" и "type"
+       (таблица "version"). При изменении только таблицы "word" выбираются лишь слова,
+       отмеченные версией новее загруженной; если после этого количество слов
+       не совпадает с таблицей (слова были удалены), либо изменилась таблица "type",
+       словарь перечитывается целиком. Новые данные подменяют текущие одним
+       присваиванием, поэтому обработчики продолжают работу со старой версией
+       во время перезагрузки.
+
+    '''
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._state = (None, {}, {})
+        self.refresh()
+
+    def refresh(self, force: bool = False) -> bool:
+        '''Функция проверки изменений словаря в базе данных и его перезагрузки.
+           Возвращает True, если словарь был обновлен.
+
+        '''
+        with self._lock, DBaseConfig.Session() as session:
+            loaded, _, by_id = self._state
+            word_version, type_version = pulling_versions(session)
+            count = session.query(func.count(Word.id_word)).scalar()
+            if loaded == (word_version, type_version, count):
+                return False
+            columns = (Word.id_word, Word.id_type, Word.title, Word.translation)
+            if loaded is not None and loaded[1] == type_version:
+                changed = session.query(*columns).filter(Word.version > loaded[0]).all()
+                by_id = dict(by_id)
+                by_id.update((word[0], tuple(word)) for word in changed)
+            if loaded is None or loaded[1] != type_version or len(by_id) != count:
+                by_id = {word[0]: tuple(word) for word in session.query(*columns).all()}
+            by_type = {}
+            for id_word, id_type, title, translation in sorted(by_id.values()):
+                by_type.setdefault(id_type, []).append((id_word, title, translation))
+            self._state = (word_version, type_version, count), by_type, by_id
+            return True
+
+    def types(self) -> list:
+        '''Функция выборки всех частей речи, к которым относятся слова словаря.
+           Возвращает список: [id_type, id_type,...]
+
+        '''
+        return list(self._state[1])
+
+    def sample_words(self, type_id: int, k: int, exclude: int | None = None) -> list:
+        '''Функция случайной выборки k слов заданной части речи (кроме слова exclude).
+           Возвращает список: [(id_word, word_title, word_translation),...]
+
+        '''
+        words = self._state[1].get(type_id, [])
+        chosen = sample(words, k=min(k + (exclude is not None), len(words)))
+        return [word for word in chosen if word[0] != exclude][:k]
+
+    def word(self, word_id: int) -> tuple | None:
+        '''Функция выборки слова по идентификатору.
+           Возвращает кортеж (id_word, id_type, word_title, word_translation) либо None.
+
+        '''
+        return self._state[2].get(word_id)
+
+    def __len__(self) -> int:
+        return len(self._state[2])
+
+
+class VocabularyWatcher(threading.Thread):
+    '''Класс фонового потока, периодически проверяющего изменения словаря
+       (VocabularyCache либо VocabularySnapshot) и перезагружающего его.
+       Если словарь в базе данных изменился после формирования снимка,
+       поток публикует новый снимок (при нескольких процессах бота его может
+       опубликовать любой из них, остальные перечитают опубликованный файл).
+
+    '''
+    def __init__(self, vocabulary, interval: float = 60.0) -> None:
+        super().__init__(name='vocabulary-watcher', daemon=True)
+        self.vocabulary = vocabulary
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            try:
+                if isinstance(self.vocabulary, VocabularySnapshot) and self.vocabulary.outdated():
+                    VocabularySnapshot.publish(self.vocabulary.path)
+                if self.vocabulary.refresh(force=True):
+                    logger.info('Словарь перезагружен: %s слов', len(self.vocabulary))
+            except Exception:
+                logger.exception('Ошибка перезагрузки словаря')
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+
+def pulling_versions(session) -> tuple:
+    '''Функция выборки счетчиков изменений словаря из таблицы "version".
+       Возвращает кортеж: (счетчик таблицы "word", счетчик таблицы "type")
+
+    '''
+    versions = dict(session.query(Version.title, Version.value).all())
+    return versions.get('word', 0), versions.get('type', 0)
+
+
+class _IndexColumn:
+    '''Вспомогательный класс-последовательность id_word индекса слов
+       для двоичного поиска (bisect) без копирования индекса.
+
+    '''
+    def __init__(self, view: memoryview, offset: int, length: int) -> None:
+        self.view, self.offset, self.length = view, offset, length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, position: int) -> int:
+        return INDEX_RECORD.unpack_from(self.view, self.offset + position * INDEX_RECORD.size)[0]
+
+
+if __name__ == '__main__':
+    print(f'Vocabulary snapshot published: {VocabularySnapshot.publish()} words.')